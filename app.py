@@ -1,3 +1,4 @@
+import logging
 from datetime import timedelta
 
 import streamlit as st
@@ -6,6 +7,10 @@ import yaml
 from yaml.loader import SafeLoader
 import visualize
 import utils
+import sessions
+import polars_engine
+
+logger = logging.getLogger(__name__)
 
 st.set_page_config(layout="wide")
 
@@ -40,6 +45,12 @@ authenticator = stauth.Authenticate(
     config['cookie']['expiry_days'],
     config['preauthorized']
 )
+sessions.configure(config.get('session', {}).get('idle_eviction_minutes', 30))
+
+# The pandas pipeline is the default, Polars is used when configured and installed
+engine = config.get('processing', {}).get('engine', 'pandas')
+if engine == 'polars' and not polars_engine.AVAILABLE:
+    engine = 'pandas'
 
 name, authentication_status, username = authenticator.login()
 if st.session_state["authentication_status"]:
@@ -66,10 +77,22 @@ if st.session_state["authentication_status"]:
     st.session_state['files'] = True
 
     if st.session_state.generate_dashboard and st.session_state.files:
-        filtered_df = visualize.UploadMultipleSailReports(files).upload()
-        if filtered_df.empty:
+        sessions.begin_run()
+        if not files:
+            st.stop()
+        # Processed data is shared between sessions that uploaded the same files. The frames below are read-only:
+        # never assign columns or modify them in place, see sessions.get_shared
+        uploaded_files_key = (sessions.files_key(files), engine)
+        if engine == 'polars':
+            filtered_df = sessions.get_shared('uploaded', uploaded_files_key,
+                                              lambda: polars_engine.upload_sail_reports(files))
+            ships_df = filtered_df.select('Schip').to_pandas()
+        else:
+            filtered_df = sessions.get_shared('uploaded', uploaded_files_key,
+                                              lambda: visualize.UploadMultipleSailReports(files).upload())
+            ships_df = filtered_df
+        if len(filtered_df) == 0:
             st.stop()
-        st.session_state['filtered_df'] = filtered_df
 
         # Sidebar for configuration
         st.sidebar.markdown("## Configuration")
@@ -79,7 +102,7 @@ if st.session_state["authentication_status"]:
                                          ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'),
                                          index=5)
 
-        ship_config = utils.assign_default_value_as_contract_hours(filtered_df)
+        ship_config = utils.assign_default_value_as_contract_hours(ships_df)
         st.sidebar.markdown("Enter the number of weekly contract hours for each ship")
         edited_ship_config = st.sidebar.data_editor(ship_config, hide_index=True)
         dict_ship_config = edited_ship_config.set_index('Schip')['Contracturen'].to_dict()
@@ -91,8 +114,24 @@ if st.session_state["authentication_status"]:
         if f == 'Yes':
             filter_boolean = True
 
-        filtered_df = utils.split_rows_on_day_change(filtered_df)
-        filtered_df = utils.split_dataframe_into_weeks(filtered_df, start_of_week)
+        def process_weeks():
+            if engine == 'polars':
+                lf = polars_engine.split_rows_on_day_change(filtered_df.lazy())
+                df = polars_engine.to_pandas(polars_engine.split_dataframe_into_weeks(lf, start_of_week))
+            else:
+                df = utils.split_rows_on_day_change(filtered_df)
+                df = utils.split_dataframe_into_weeks(df, start_of_week)
+            cumulative_minutes = utils.build_cumulative_minutes(df)
+            return (df, visualize.dataset_hash(df), cumulative_minutes,
+                    utils.build_contract_hours_matrix(cumulative_minutes),
+                    visualize.build_period_hours_table(df, start_of_week))
+
+        # Shared and read-only as well, also used by the chart prefetch worker of visualize.py
+        filtered_df, df_hash, cumulative_minutes, contract_hours_matrix, period_hours_table = sessions.get_shared(
+            'weeks', (uploaded_files_key, start_of_week), process_weeks)
+        if logger.isEnabledFor(logging.DEBUG):
+            memory_usage = sessions.session_memory_usage(visualize.figure_cache_nbytes())
+            logger.debug('Session memory: %.1f MB', memory_usage / 2 ** 20)
 
         if not filter_boolean:
             filtered_df_selected_start_day = filtered_df[filtered_df['Start_Weekday'] == start_of_week]
@@ -118,7 +157,7 @@ if st.session_state["authentication_status"]:
             start = options_as_dates[converted_selection]
             end = start_end[start][0]
 
-            tab1, tab2 = st.tabs(["Week overview", "Total overview"])
+            tab1, tab2, tab3 = st.tabs(["Week overview", "Total overview", "Custom period"])
             with tab1:
                 visualize.write_week_info(start, start_of_week, end)
                 if len(dict_ship_config) <= 1:
@@ -130,19 +169,30 @@ if st.session_state["authentication_status"]:
                 start_of_weeks = []
                 for key in start_of_weeks_with_weekday:
                     start_of_weeks.append(start_of_weeks_with_weekday[key])
-                visualize.show_period_hours_as_df(filtered_df, dict_ship_config, start_of_week)
+                visualize.show_period_hours_as_df(period_hours_table, dict_ship_config)
+            with tab3:
+                visualize.show_custom_period(cumulative_minutes, dict_ship_config)
 
-            tab1, tab2, tab3 = st.tabs(["Timeline", "Activity Time Per Day", "Average Activity Time"])
+            tab1, tab2, tab3, tab4 = st.tabs(["Timeline", "Activity Time Per Day", "Average Activity Time",
+                                              "Fleet Utilization"])
             with tab1:
                 st.plotly_chart(
-                    visualize.VisualisationPlanning(filtered_df).calls_gantt_chart(start, end),
+                    visualize.cached_gantt_chart(filtered_df, df_hash, start, end, start_of_week),
                     use_container_width=True)
             with tab2:
                 st.plotly_chart(
-                    visualize.VisualisationPlanning(filtered_df).activity_line_chart(start),
+                    visualize.cached_activity_line_chart(filtered_df, df_hash, start, start_of_week),
                     use_container_width=True)
             with tab3:
                 st.plotly_chart(visualize.VisualisationPlanning(filtered_df).activity_trend())
+            with tab4:
+                st.plotly_chart(
+                    visualize.fleet_utilization_heatmap(*contract_hours_matrix, dict_ship_config),
+                    use_container_width=True)
+
+            # Build the charts of the previous and next week while the user looks at this one
+            weeks = [(week_start, start_end[week_start][0]) for week_start in options_as_dates.values()]
+            visualize.prefetch_adjacent_weeks(filtered_df, df_hash, weeks, start, start_of_week)
         else:
             start_end, options_as_dates = utils.get_required_rows(dict_ship_config, filtered_df, filter_boolean)
             start_of_weeks = sorted(filtered_df['Start_Date'].unique().tolist())
@@ -170,7 +220,7 @@ if st.session_state["authentication_status"]:
                             end = el['End']
             end_next_day = (end + timedelta(seconds=1)).date()
 
-            tab1, tab2 = st.tabs(["Week overview", "Total overview"])
+            tab1, tab2, tab3 = st.tabs(["Week overview", "Total overview", "Custom period"])
             with tab1:
                 st.write("The selected week is for ship", ship, "and is from", str(start.date().strftime('%d-%m-%Y')), " to ", str(end_next_day.strftime('%d-%m-%Y')), ".")
                 visualize.show_week_hours(filtered_df, ship, start, dict_ship_config)
@@ -178,19 +228,31 @@ if st.session_state["authentication_status"]:
                 start_of_weeks = []
                 for key in start_of_weeks_with_weekday:
                     start_of_weeks.append(start_of_weeks_with_weekday[key])
-                visualize.show_period_hours_as_df(filtered_df, dict_ship_config, start_of_week)
+                visualize.show_period_hours_as_df(period_hours_table, dict_ship_config)
+            with tab3:
+                visualize.show_custom_period(cumulative_minutes, dict_ship_config)
 
-            tab1, tab2, tab3 = st.tabs(["Timeline", "Activity Time Per Day", "Average Activity Time"])
+            tab1, tab2, tab3, tab4 = st.tabs(["Timeline", "Activity Time Per Day", "Average Activity Time",
+                                              "Fleet Utilization"])
             with tab1:
                 st.plotly_chart(
-                    visualize.VisualisationPlanning(filtered_df).calls_gantt_chart(start, end, ship),
+                    visualize.cached_gantt_chart(filtered_df, df_hash, start, end, start_of_week, ship),
                     use_container_width=True)
             with tab2:
                 st.plotly_chart(
-                    visualize.VisualisationPlanning(filtered_df).activity_line_chart(start),
+                    visualize.cached_activity_line_chart(filtered_df, df_hash, start, start_of_week),
                     use_container_width=True)
             with tab3:
                 st.plotly_chart(visualize.VisualisationPlanning(filtered_df).activity_trend())
+            with tab4:
+                st.plotly_chart(
+                    visualize.fleet_utilization_heatmap(*contract_hours_matrix, dict_ship_config),
+                    use_container_width=True)
+
+            # Build the charts of the previous and next week of this ship while the user looks at this one
+            weeks = sorted((week_start, el['End']) for week_start in start_end
+                           for el in start_end[week_start] if el['Ship'] == ship)
+            visualize.prefetch_adjacent_weeks(filtered_df, df_hash, weeks, start, start_of_week, ship)
             st.divider()
 
     elif not st.session_state["authentication_status"]:
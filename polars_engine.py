@@ -0,0 +1,213 @@
+"""
+Optional Polars implementation of the processing pipeline in utils.py and visualize.py.
+
+The steps build lazy query plans that Polars executes on all cores. The result is only converted to pandas by
+to_pandas(), right before it is handed to Plotly and Streamlit.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+AVAILABLE = pl is not None
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+ACTIVITY_COLUMNS = ['Vaaruren', 'Wachttijd', 'Rusttijd', 'Laad/Lostijd']
+# Columns read as text from the ship report
+PARSED_COLUMNS = ['Niet-flexibel', 'Start', 'Einde'] + ACTIVITY_COLUMNS
+# Columns kept by utils.split_rows_on_day_change for rows that are split at midnight, in that order
+SPLIT_COLUMNS = ['Start', 'Einde', 'Van', 'Tot', 'Vaaruren', 'Wachttijd', 'Rusttijd', 'Laad/Lostijd', 'Snelheid',
+                 'Schip', 'Start_Date', 'Einde_Date', 'Start_Weekday', 'Einde_Weekday']
+
+
+def _minutes(column, has_missing):
+    """ Convert a column of H:MM strings to total minutes, like utils.convert_to_minutes. """
+    parts = pl.col(column).str.split(':')
+    minutes = (parts.list.get(0).cast(pl.Int64) * 60 + parts.list.get(1).cast(pl.Int64)).fill_null(0)
+    # In pandas a column with missing values becomes float64 before the fillna(0)
+    return (minutes.cast(pl.Float64) if has_missing else minutes).alias(column)
+
+
+def parse_sail_report(lf, barge, columns_with_missing=()):
+    """
+    Polars version of UploadSailReport.upload, after the header rows are removed.
+
+    :param columns_with_missing: The activity columns that have empty cells, these become floats like in pandas.
+    """
+    lf = lf.with_columns(pl.col('Niet-flexibel').forward_fill())
+    lf = lf.with_columns(Date=pl.col('Niet-flexibel').str.extract(r'\((\d{1,2}-\d{1,2})\)', 1) + '-2024')
+
+    # The end time contains the date of the next day in parentheses when the activity ends after midnight
+    next_day = pl.col('Einde').str.extract(r'\((\d{1,2} \w{3})\)', 1)
+    time_part = pl.col('Einde').str.split(' ').list.first()
+    einde_next_day = (next_day + ' 2024 ' + time_part).str.strptime(pl.Datetime('ns'), '%d %b %Y %H:%M',
+                                                                      strict=False)
+    einde_same_day = (pl.col('Date') + ' ' + pl.col('Einde')).str.strptime(pl.Datetime('ns'), '%d-%m-%Y %H:%M',
+                                                                            strict=False)
+    lf = lf.with_columns(
+        (pl.col('Date') + ' ' + pl.col('Start')).str.strptime(pl.Datetime('ns'), '%d-%m-%Y %H:%M').alias('Start'),
+        pl.when(next_day.is_not_null()).then(einde_next_day).otherwise(einde_same_day).alias('Einde'),
+        *[_minutes(column, column in columns_with_missing) for column in ACTIVITY_COLUMNS])
+
+    lf = lf.drop(['Niet-flexibel', 'Date', 'Opmerkingen'])
+    lf = lf.with_columns(pl.col(pl.String).fill_null(''))
+
+    lf = lf.with_columns(
+        pl.lit(barge).alias('Schip'),
+        pl.col('Start').dt.date().alias('Start_Date'),
+        pl.col('Einde').dt.date().alias('Einde_Date'),
+        pl.col('Start').dt.strftime('%A').alias('Start_Weekday'),
+        pl.col('Einde').dt.strftime('%A').alias('Einde_Weekday'))
+
+    # Same as utils.update_van_tot
+    activity = (pl.when(pl.col('Rusttijd') > 0).then(pl.lit('Rust'))
+                .when(pl.col('Vaaruren') > 0).then(pl.lit('Varen'))
+                .when(pl.col('Wachttijd') > 0).then(pl.lit('Wachten')))
+    has_activity = (pl.col('Rusttijd') > 0) | (pl.col('Vaaruren') > 0) | (pl.col('Wachttijd') > 0)
+    return lf.with_columns(
+        activity.otherwise(pl.col('Van')).alias('Van'),
+        pl.when(has_activity).then(pl.lit('')).otherwise(pl.col('Tot')).alias('Tot'))
+
+
+def upload_sail_reports(files):
+    """ Polars version of UploadMultipleSailReports.upload, returning a collected Polars DataFrame. """
+    if not files:
+        return pl.DataFrame()
+
+    frames = []
+    for file in files:
+        # Excel is still read with pandas, the parsing of the rows is done by Polars
+        raw = pd.read_excel(file)
+        barge = raw.iat[1, 1]
+        raw.columns = raw.iloc[7]
+        raw = raw.iloc[8:-2].reset_index(drop=True)
+        if 'Niet-flexibel' not in raw.columns:
+            raw.rename(columns={'Dag': 'Niet-flexibel'}, inplace=True)
+        columns_with_missing = [column for column in ACTIVITY_COLUMNS if raw[column].isna().any()]
+        for column in PARSED_COLUMNS:
+            raw[column] = raw[column].astype('string')
+
+        lf = parse_sail_report(pl.from_pandas(raw).lazy(), barge, columns_with_missing)
+        frames.append(lf.with_row_index('index'))
+
+    df = pl.concat(frames, how='diagonal_relaxed').collect()
+    # Both end time formats are parsed leniently above, pandas raises on an end time that matches neither
+    if df['Einde'].null_count():
+        raise ValueError("Could not parse the end time ('Einde') of all rows of the ship report(s)")
+    return df
+
+
+def split_rows_on_day_change(lf):
+    """ Polars version of utils.split_rows_on_day_change. """
+    lf = lf.drop('index')
+    other_columns = [column for column in lf.collect_schema().names() if column not in SPLIT_COLUMNS]
+
+    start_date = pl.col('Start').dt.date()
+    end_date = pl.col('Einde').dt.date()
+    is_split = (end_date - start_date).dt.total_days() >= 1
+    lf = lf.with_columns(
+        is_split.alias('_split'),
+        # The column order of the pandas result depends on whether the first row is split, see to_pandas()
+        is_split.first().alias('_first_row_split'),
+        pl.when(is_split).then(pl.date_ranges(start_date, end_date)).otherwise(pl.concat_list(start_date))
+        .alias('_day'))
+    lf = lf.explode('_day')
+
+    split = pl.col('_split')
+    day_start = pl.col('_day').cast(pl.Datetime('ns'))
+    day_end = day_start + pl.duration(hours=23, minutes=59, seconds=59, time_unit='ns')
+    new_start = pl.when(split & (pl.col('_day') != start_date)).then(day_start).otherwise(pl.col('Start'))
+    new_end = pl.when(split & (pl.col('_day') != end_date)).then(day_end).otherwise(pl.col('Einde'))
+    minutes = ((new_end - new_start).dt.total_seconds() + 59) // 60
+
+    # The minutes of the day go to the first activity of the original row
+    vaaruren = pl.col('Vaaruren') > 0
+    wachttijd = pl.col('Wachttijd') > 0
+    rusttijd = pl.col('Rusttijd') > 0
+    lf = lf.with_columns(
+        new_start.alias('Start'),
+        new_end.alias('Einde'),
+        pl.when(split & vaaruren).then(minutes).otherwise(pl.col('Vaaruren')).alias('Vaaruren'),
+        pl.when(split & ~vaaruren & wachttijd).then(minutes).otherwise(pl.col('Wachttijd')).alias('Wachttijd'),
+        pl.when(split & ~vaaruren & ~wachttijd & rusttijd).then(minutes).otherwise(pl.col('Rusttijd'))
+        .alias('Rusttijd'),
+        pl.when(split & ~vaaruren & ~wachttijd & ~rusttijd).then(minutes).otherwise(pl.col('Laad/Lostijd'))
+        .alias('Laad/Lostijd'),
+        pl.when(split).then(new_start.dt.date()).otherwise(pl.col('Start_Date')).alias('Start_Date'),
+        pl.when(split).then(new_start.dt.date()).otherwise(pl.col('Einde_Date')).alias('Einde_Date'),
+        pl.when(split).then(new_start.dt.strftime('%A')).otherwise(pl.col('Start_Weekday')).alias('Start_Weekday'),
+        pl.when(split).then(new_start.dt.strftime('%A')).otherwise(pl.col('Einde_Weekday')).alias('Einde_Weekday'),
+        # Split rows only keep the columns in SPLIT_COLUMNS
+        *[pl.when(split).then(None).otherwise(pl.col(column)).alias(column) for column in other_columns])
+
+    return lf.drop(['_split', '_day'])
+
+
+def _pandas_mean(series):
+    values = series.drop_nulls().to_numpy()
+    return np.sum(values) / len(values) if len(values) else None
+
+
+def _hours(minutes):
+    return minutes.map_batches(lambda series: pl.Series(series.to_numpy() / 60), return_dtype=pl.Float64)
+
+
+def split_dataframe_into_weeks(lf, day='Saturday'):
+    """ Polars version of utils.split_dataframe_into_weeks, including the weekly summary columns. """
+    if isinstance(day, int):
+        day = WEEKDAYS[day]
+    start_day = WEEKDAYS.index(day)
+
+    # Ships in sorted order like DataFrame.groupby, keeping the order of the rows within each ship
+    lf = lf.sort('Schip', maintain_order=True)
+
+    ind_next = pl.col('Start_Weekday').replace_strict(WEEKDAYS, list(range(len(WEEKDAYS))), return_dtype=pl.Int64)
+    ind = ind_next.shift(1)
+    new_week = (ind_next >= start_day) & (((ind_next > ind) & (ind < start_day))
+                                          | ((ind_next < ind) & (ind > start_day)))
+    # The rows are sorted by ship, so the first row of each ship starts a week as well and a running count over all
+    # rows numbers the weeks of all ships
+    new_ship = (pl.col('Schip') != pl.col('Schip').shift(1)).fill_null(True)
+    lf = lf.with_columns((new_ship | new_week.fill_null(False)).cast(pl.UInt32).cum_sum().alias('_week'))
+
+    week = ['Schip', '_week']
+    # Rounded with NumPy like pandas, Polars' round does not round halves to even in all versions
+    lf = lf.with_columns(pl.col('Snelheid').str.replace_all('km/u', '', literal=True).str.strip_chars()
+                         .cast(pl.Float64)
+                         .map_batches(lambda series: pl.Series(np.round(series.to_numpy(), 1)),
+                                      return_dtype=pl.Float64, is_elementwise=True))
+    # The weekly values are computed on one row per week and joined back. They are computed the same way as in
+    # pandas: Series.mean is np.sum / count, and Polars divides by a literal by multiplying with its reciprocal,
+    # which can differ in the last bit
+    weekly = lf.group_by(week).agg(
+        pl.col('Snelheid').map_batches(_pandas_mean, return_dtype=pl.Float64, returns_scalar=True)
+        .alias('Snelheid_week_gem'),
+        *[pl.col(column).sum() for column in ACTIVITY_COLUMNS])
+    weekly = weekly.with_columns(
+        _hours(pl.col('Vaaruren')).alias('Vaaruren_week'),
+        _hours(pl.col('Wachttijd')).alias('Wachttijd_week'),
+        _hours(pl.col('Laad/Lostijd')).alias('Laad/Lostijd_week'),
+        _hours(pl.col('Rusttijd')).alias('Rusttijd_week'),
+        _hours(pl.col('Vaaruren') + pl.col('Wachttijd') + pl.col('Laad/Lostijd')).alias('Tijd onder contract'))
+    lf = lf.join(weekly.drop(ACTIVITY_COLUMNS), on=week, how='left', maintain_order='left')
+
+    return lf.drop('_week')
+
+
+def to_pandas(lf):
+    """ Execute the query plan and convert the result to the pandas DataFrame of the pandas pipeline. """
+    df = lf.collect()
+    first_row_split = len(df) > 0 and df['_first_row_split'][0]
+    df = df.drop('_first_row_split')
+
+    # pd.DataFrame(rows) in utils.split_rows_on_day_change takes the column order of the first row
+    if first_row_split:
+        df = df.select(SPLIT_COLUMNS + [column for column in df.columns if column not in SPLIT_COLUMNS])
+
+    pandas_df = df.to_pandas()
+    for column in ['Start_Date', 'Einde_Date']:
+        pandas_df[column] = pandas_df[column].dt.date
+    return pandas_df
@@ -0,0 +1,121 @@
+import hashlib
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Sessions that did not rerun for this long are evicted, see configure()
+IDLE_EVICTION_SECONDS = 30 * 60
+
+# Processed data shared by all sessions: key -> (value, size in bytes)
+_shared = {}
+# Per session the time of its last run and per slot the key of the shared data it uses
+_sessions = {}
+_lock = threading.Lock()
+
+
+def configure(idle_eviction_minutes):
+    """ Set after how many idle minutes the data of a session is freed. """
+    global IDLE_EVICTION_SECONDS
+    IDLE_EVICTION_SECONDS = idle_eviction_minutes * 60
+
+
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def files_key(files):
+    """ Return a key identifying the contents of the uploaded files. """
+    digest = hashlib.sha1()
+    for file in files:
+        digest.update(file.name.encode())
+        digest.update(file.getvalue())
+    return digest.hexdigest()
+
+
+def estimate_nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'estimated_size'):
+        # Polars DataFrame
+        return int(value.estimated_size())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def begin_run():
+    """
+    Register a run of the current session and free the data of sessions that were idle for too long.
+
+    Shared data that is no longer used by any session is dropped as well.
+    """
+    now = time.time()
+    session_id = current_session_id()
+    with _lock:
+        _sessions.setdefault(session_id, {'last_seen': now, 'slots': {}})['last_seen'] = now
+
+        for idle_session_id in [other for other, session in _sessions.items()
+                                if now - session['last_seen'] > IDLE_EVICTION_SECONDS]:
+            del _sessions[idle_session_id]
+
+        used_keys = {key for session in _sessions.values() for key in session['slots'].values()}
+        for key in [key for key in _shared if key not in used_keys]:
+            del _shared[key]
+
+
+def get_shared(slot, key, build):
+    """
+    Return the shared data for key, building it once for all sessions.
+
+    The result is shared without copying between all sessions and the chart prefetch worker. This is a contract,
+    not enforced: callers must treat it as read-only, so no column assignment, inplace operation or setting of
+    values on it. Derive new frames instead, e.g. with DataFrame.assign or by selecting rows or columns first.
+
+    :param slot: The name under which the current session uses the data, e.g. 'weeks'. A session uses a single key
+    per slot, so data of a previous key is freed once no other session uses it.
+    :param key: Hashable key identifying the data, e.g. the hash of the uploaded files.
+    :param build: Function without arguments that builds the data.
+    """
+    with _lock:
+        entry = _shared.get(key)
+    if entry is None:
+        value = build()
+        entry = (value, estimate_nbytes(value))
+        with _lock:
+            entry = _shared.setdefault(key, entry)
+
+    session_id = current_session_id()
+    with _lock:
+        _sessions.setdefault(session_id, {'last_seen': time.time(), 'slots': {}})['slots'][slot] = key
+    return entry[0]
+
+
+def session_memory_usage(shared_cache_nbytes=0):
+    """
+    Return the number of bytes of shared data used by the current session.
+
+    Data used by several sessions is divided equally among them.
+
+    :param shared_cache_nbytes: Size of caches used by all sessions alike, such as the figure cache in visualize.py.
+    It is divided equally among all sessions.
+    """
+    session_id = current_session_id()
+    with _lock:
+        if session_id not in _sessions:
+            return 0
+        users = {}
+        for session in _sessions.values():
+            for key in session['slots'].values():
+                users[key] = users.get(key, 0) + 1
+        return (sum(_shared[key][1] / users[key] for key in _sessions[session_id]['slots'].values()
+                    if key in _shared)
+                + shared_cache_nbytes / len(_sessions))
@@ -0,0 +1,71 @@
+"""
+Synthetic ship reports for the tests, in the Excel layout of the Cofano BOS ship reports.
+"""
+import io
+import random
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import utils  # noqa: E402
+import visualize  # noqa: E402
+
+REPORT_COLUMNS = ['Niet-flexibel', 'Start', 'Einde', 'Van', 'Tot', 'Vaaruren', 'Wachttijd', 'Rusttijd',
+                  'Laad/Lostijd', 'Snelheid', 'Afstand', 'Opmerkingen']
+DUTCH_DAYS = ['Maandag', 'Dinsdag', 'Woensdag', 'Donderdag', 'Vrijdag', 'Zaterdag', 'Zondag']
+ACTIVITIES = ['Vaaruren', 'Wachttijd', 'Rusttijd', 'Laad/Lostijd']
+
+
+def synthetic_report(barge, seed, first_day='2024-07-27', days=24, first_hour=None):
+    """ Build the bytes of an Excel ship report in the layout that UploadSailReport.upload expects. """
+    rng = random.Random(seed)
+    rows = []
+    if first_hour is None:
+        first_hour = rng.randint(0, 12)
+    time = pd.Timestamp(first_day) + pd.Timedelta(hours=first_hour)
+    end_of_report = pd.Timestamp(first_day) + pd.Timedelta(days=days)
+    last_day = None
+    while time < end_of_report:
+        activity = rng.choice(ACTIVITIES)
+        # Mostly short activities, sometimes rest or waiting spanning one or more midnights
+        minutes = rng.choice([rng.randint(15, 8 * 60), rng.randint(8 * 60, 50 * 60)])
+        if not rows and first_hour >= 20:
+            # Let the first row cross midnight, the column order of the pandas result depends on it
+            minutes = 10 * 60
+        end = time + pd.Timedelta(minutes=minutes)
+
+        day = ''
+        if time.date() != last_day:
+            day = f"{DUTCH_DAYS[time.weekday()]} ({time.strftime('%d-%m')})"
+            last_day = time.date()
+        einde = end.strftime('%H:%M')
+        if end.date() != time.date():
+            einde += f" ({end.strftime('%d %b')})"
+
+        row = {'Niet-flexibel': day or None, 'Start': time.strftime('%H:%M'), 'Einde': einde,
+               'Van': rng.choice(['Rotterdam', 'Antwerpen', 'Duisburg']), 'Tot': rng.choice(['Moerdijk', None]),
+               'Snelheid': f"{rng.uniform(8, 16):.2f} km/u", 'Afstand': f'{rng.randint(0, 120)} km',
+               'Opmerkingen': rng.choice([None, 'Opmerking'])}
+        for column in ACTIVITIES:
+            row[column] = f'{minutes // 60}:{minutes % 60:02d}' if column == activity else None
+        rows.append([row[column] for column in REPORT_COLUMNS])
+        time = end + pd.Timedelta(minutes=rng.choice([0, 0, 15]))
+
+    width = len(REPORT_COLUMNS)
+    sheet = [['Scheepsrapport'] + [None] * (width - 1)]
+    sheet += [[None] * width for _ in range(7)]
+    sheet[2][0], sheet[2][1] = 'Schip', barge
+    sheet += [REPORT_COLUMNS] + rows + [['Totaal'] + [None] * (width - 1), [None] * width]
+
+    buffer = io.BytesIO()
+    pd.DataFrame(sheet).to_excel(buffer, header=False, index=False)
+    return buffer.getvalue()
+
+
+def pandas_pipeline(reports, start_of_week):
+    df = visualize.UploadMultipleSailReports([io.BytesIO(report) for report in reports]).upload()
+    df = utils.split_rows_on_day_change(df)
+    return utils.split_dataframe_into_weeks(df, start_of_week)
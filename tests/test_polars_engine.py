@@ -0,0 +1,55 @@
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+pl = pytest.importorskip('polars')
+
+import polars_engine  # noqa: E402
+from synthetic_reports import REPORT_COLUMNS, pandas_pipeline, synthetic_report  # noqa: E402
+
+
+def polars_pipeline(reports, start_of_week):
+    df = polars_engine.upload_sail_reports([io.BytesIO(report) for report in reports])
+    lf = polars_engine.split_rows_on_day_change(df.lazy())
+    return polars_engine.to_pandas(polars_engine.split_dataframe_into_weeks(lf, start_of_week))
+
+
+REPORTS = {
+    'two ships': [('Barge B', 1, '2024-07-27', None), ('Barge A', 2, '2024-08-02', None)],
+    'first row split': [('Barge C', 3, '2024-07-30', 22)],
+    # The reports carry no year, both engines assume 2024, so the synthetic reports stay within 2024
+    'long report': [('Barge D', 4, '2024-09-01', None)],
+}
+
+
+@pytest.mark.parametrize('start_of_week', ['Saturday', 'Monday', 'Wednesday'])
+@pytest.mark.parametrize('name', list(REPORTS))
+def test_polars_engine_matches_pandas(name, start_of_week):
+    reports = [synthetic_report(barge, seed, first_day, days=70 if name == 'long report' else 24,
+                                first_hour=first_hour)
+               for barge, seed, first_day, first_hour in REPORTS[name]]
+
+    expected = pandas_pipeline(reports, start_of_week)
+    result = polars_pipeline(reports, start_of_week)
+
+    # Every row falls within a single day after the midnight split
+    assert (expected['Start_Date'] == expected['Einde_Date']).all()
+    pd.testing.assert_frame_equal(result, expected, check_exact=True)
+
+
+def test_polars_engine_rejects_unparseable_end_time():
+    report = synthetic_report('Barge E', seed=5)
+    df = pd.read_excel(io.BytesIO(report), header=None)
+    df.iat[10, REPORT_COLUMNS.index('Einde')] = 'morgen'
+    buffer = io.BytesIO()
+    df.to_excel(buffer, header=False, index=False)
+
+    with pytest.raises(ValueError):
+        pandas_pipeline([buffer.getvalue()], 'Saturday')
+    with pytest.raises(ValueError):
+        polars_pipeline([buffer.getvalue()], 'Saturday')
@@ -0,0 +1,110 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from synthetic_reports import pandas_pipeline, synthetic_report
+
+import sessions
+import utils
+import visualize
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def session_store(monkeypatch):
+    """ An empty session store with a fake clock, where the current session is set through the returned dict. """
+    state = {'session_id': 'a'}
+    clock = Clock()
+    monkeypatch.setattr(sessions, '_shared', {})
+    monkeypatch.setattr(sessions, '_sessions', {})
+    monkeypatch.setattr(sessions, 'time', clock)
+    monkeypatch.setattr(sessions, 'current_session_id', lambda: state['session_id'])
+    monkeypatch.setattr(sessions, 'IDLE_EVICTION_SECONDS', 60)
+    return state, clock
+
+
+def test_get_shared_builds_once_for_all_sessions(session_store):
+    state, _ = session_store
+    builds = []
+
+    for session_id in ['a', 'b']:
+        state['session_id'] = session_id
+        sessions.begin_run()
+        value = sessions.get_shared('weeks', 'key', lambda: builds.append(1) or pd.DataFrame({'x': [1, 2]}))
+
+    assert len(builds) == 1
+    assert value is sessions._shared['key'][0]
+
+
+def test_idle_sessions_are_evicted_and_their_data_is_freed(session_store):
+    state, clock = session_store
+    sessions.begin_run()
+    sessions.get_shared('weeks', 'key a', lambda: pd.DataFrame({'x': [1]}))
+
+    state['session_id'] = 'b'
+    clock.now = 30
+    sessions.begin_run()
+    assert set(sessions._sessions) == {'a', 'b'}
+    assert 'key a' in sessions._shared
+
+    clock.now = 61
+    sessions.begin_run()
+    assert set(sessions._sessions) == {'b'}
+    assert 'key a' not in sessions._shared
+
+
+def test_a_key_is_freed_once_no_session_uses_it(session_store):
+    state, _ = session_store
+    for session_id in ['a', 'b']:
+        state['session_id'] = session_id
+        sessions.begin_run()
+        sessions.get_shared('weeks', 'old key', lambda: pd.DataFrame({'x': [1]}))
+
+    # Session a switches to other data, b still uses the old key
+    state['session_id'] = 'a'
+    sessions.begin_run()
+    sessions.get_shared('weeks', 'new key', lambda: pd.DataFrame({'x': [2]}))
+    sessions.begin_run()
+    assert {'old key', 'new key'} <= set(sessions._shared)
+
+    state['session_id'] = 'b'
+    sessions.begin_run()
+    sessions.get_shared('weeks', 'new key', lambda: pd.DataFrame({'x': [3]}))
+    sessions.begin_run()
+    assert set(sessions._shared) == {'new key'}
+
+
+def test_charts_and_tables_do_not_modify_the_shared_frame(session_store):
+    df = sessions.get_shared('weeks', 'key', lambda: pandas_pipeline(
+        [synthetic_report('Barge A', 1), synthetic_report('Barge B', 2, '2024-08-05')], 'Saturday'))
+    columns, dtypes = df.columns.tolist(), df.dtypes.copy()
+    df_hash = pd.util.hash_pandas_object(df).copy()
+
+    ship_config = {'Barge A': 112, 'Barge B': 80}
+    start = df.loc[df['Start_Weekday'] == 'Saturday', 'Start'].iloc[0]
+    start_end, _ = utils.get_required_rows(ship_config, df, False)
+    utils.get_required_rows(ship_config, df, True)
+    end = start_end[start][0]
+    cumulative = utils.build_cumulative_minutes(df)
+    visualize.fleet_utilization_heatmap(*utils.build_contract_hours_matrix(cumulative), ship_config)
+    visualize.show_week_hours(df, 'Barge A', start, ship_config)
+    visualize.show_week_hours_as_df(df, start, ship_config, 'Saturday')
+    visualize.show_period_hours_as_df(visualize.build_period_hours_table(df, 'Saturday'), ship_config)
+    visualize.show_range_hours_as_df(cumulative, ship_config, date(2024, 8, 1), date(2024, 8, 7))
+    planning = visualize.VisualisationPlanning(df)
+    planning.calls_gantt_chart(start, end)
+    planning.calls_gantt_chart(start, end, 'Barge A')
+    planning.activity_line_chart(start)
+    planning.activity_trend()
+
+    assert df.columns.tolist() == columns
+    pd.testing.assert_series_equal(df.dtypes, dtypes)
+    pd.testing.assert_series_equal(pd.util.hash_pandas_object(df), df_hash)
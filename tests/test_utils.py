@@ -0,0 +1,81 @@
+import random
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from synthetic_reports import pandas_pipeline, synthetic_report
+
+import utils
+
+
+@pytest.fixture(scope='module')
+def processed_df():
+    reports = [synthetic_report('Barge A', 1, '2024-07-27', days=24),
+               synthetic_report('Barge B', 2, '2024-08-10', days=30)]
+    df = pandas_pipeline(reports, 'Saturday')
+    # Leave a few days without any rows
+    return df[~df['Start_Date'].isin([date(2024, 8, 3), date(2024, 8, 4), date(2024, 8, 20)])]
+
+
+def direct_minutes(df, ship, start_date, end_date):
+    rows = df[(df['Schip'] == ship) & (df['Start_Date'] >= start_date) & (df['Start_Date'] <= end_date)]
+    return rows[utils.ACTIVITY_COLUMNS].sum().to_dict()
+
+
+@pytest.mark.parametrize('ship, start_date, end_date', [
+    # Before the first day of the ship
+    ('Barge B', date(2024, 7, 1), date(2024, 8, 9)),
+    # After the last day of the ship
+    ('Barge A', date(2024, 8, 25), date(2024, 9, 30)),
+    # Partly before and partly after the reports of the ship
+    ('Barge A', date(2024, 7, 1), date(2024, 9, 30)),
+    # A single day
+    ('Barge A', date(2024, 8, 1), date(2024, 8, 1)),
+    # A single day without rows
+    ('Barge A', date(2024, 8, 3), date(2024, 8, 3)),
+    # A range with days without rows
+    ('Barge B', date(2024, 8, 18), date(2024, 8, 22)),
+    # The end before the start
+    ('Barge A', date(2024, 8, 10), date(2024, 8, 5)),
+])
+def test_range_minutes_edge_cases(processed_df, ship, start_date, end_date):
+    cumulative = utils.build_cumulative_minutes(processed_df)
+
+    assert (utils.get_range_minutes(cumulative, ship, start_date, end_date)
+            == direct_minutes(processed_df, ship, start_date, end_date))
+
+
+def test_range_minutes_match_direct_sum(processed_df):
+    cumulative = utils.build_cumulative_minutes(processed_df)
+    rng = random.Random(0)
+    first_day, last_day = date(2024, 7, 17), date(2024, 9, 19)
+
+    for _ in range(300):
+        ship = rng.choice(['Barge A', 'Barge B'])
+        start_date = first_day + timedelta(days=rng.randint(0, (last_day - first_day).days))
+        end_date = start_date + timedelta(days=rng.randint(0, 40))
+
+        assert (utils.get_range_minutes(cumulative, ship, start_date, end_date)
+                == direct_minutes(processed_df, ship, start_date, end_date))
+
+
+def test_contract_hours_matrix_pads_with_nan_and_keeps_the_offset_of_each_ship(processed_df):
+    # Barge A covers 27-07 up to 20-08 and Barge B 10-08 up to 09-09, so the periods are offset and partly overlap
+    ships, days, matrix = utils.build_contract_hours_matrix(utils.build_cumulative_minutes(processed_df))
+
+    assert ships == ['Barge A', 'Barge B']
+    assert days[0] == np.datetime64(processed_df['Start_Date'].min())
+    assert days[-1] == np.datetime64(processed_df['Start_Date'].max())
+    for i, ship in enumerate(ships):
+        ship_df = processed_df[processed_df['Schip'] == ship]
+        first_day, last_day = np.datetime64(ship_df['Start_Date'].min()), np.datetime64(ship_df['Start_Date'].max())
+        covered = (days >= first_day) & (days <= last_day)
+
+        assert covered.any() and not covered.all()
+        assert np.isnan(matrix[i, ~covered]).all()
+        # Days without rows within the period of the ship are 0 hours, not missing
+        hours_per_day = (ship_df.groupby('Start_Date')[utils.CONTRACT_COLUMNS].sum().sum(axis=1) / 60)
+        expected = hours_per_day.reindex(days[covered].astype(object), fill_value=0).to_numpy()
+        np.testing.assert_allclose(matrix[i, covered], expected)
+        assert np.nansum(matrix[i]) == pytest.approx(ship_df[utils.CONTRACT_COLUMNS].to_numpy().sum() / 60)
@@ -1,8 +1,12 @@
 import math
 
+import numpy as np
 import pandas as pd
 import re
 
+CONTRACT_COLUMNS = ['Vaaruren', 'Wachttijd', 'Laad/Lostijd']
+ACTIVITY_COLUMNS = CONTRACT_COLUMNS + ['Rusttijd']
+
 
 def adjust_datetime(row):
     # Ensure that the value is a string before applying regex
@@ -143,6 +147,83 @@ def get_required_rows(ship_config, df, filter_boolean):
     return start_end, options_as_dates
 
 
+def build_cumulative_minutes(df):
+    """
+    Build per ship a prefix sum of the activity minutes per day, so the totals of any date range can be looked up.
+
+    Parameters:
+    df (DataFrame): The DataFrame after split_rows_on_day_change, so that every row falls within a single day.
+
+    Returns:
+    dict: Per ship a tuple of the first day and an array of shape (days + 1, len(ACTIVITY_COLUMNS)), where row i
+    holds the minutes of all days before first day + i.
+    """
+    cumulative = {}
+    for ship, group in df.groupby('Schip'):
+        days = pd.to_datetime(group['Start_Date']).values.astype('datetime64[D]')
+        first_day = days.min()
+        day_indices = (days - first_day).astype(int)
+
+        minutes_per_day = np.zeros((day_indices.max() + 1, len(ACTIVITY_COLUMNS)))
+        np.add.at(minutes_per_day, day_indices, group[ACTIVITY_COLUMNS].to_numpy(dtype=float))
+
+        cumulative_minutes = np.zeros((len(minutes_per_day) + 1, len(ACTIVITY_COLUMNS)))
+        cumulative_minutes[1:] = minutes_per_day.cumsum(axis=0)
+        cumulative[ship] = (first_day, cumulative_minutes)
+
+    return cumulative
+
+
+def get_range_minutes(cumulative, ship, start_date, end_date):
+    """
+    Get the activity minutes of a ship from start_date up to and including end_date.
+
+    Parameters:
+    cumulative (dict): The result of build_cumulative_minutes.
+    ship (str): The ship to get the totals for.
+    start_date (date): The first day of the range.
+    end_date (date): The last day of the range.
+
+    Returns:
+    dict: The total minutes per column in ACTIVITY_COLUMNS.
+    """
+    first_day, cumulative_minutes = cumulative[ship]
+    days = len(cumulative_minutes) - 1
+
+    start_index = min(max(int((np.datetime64(start_date, 'D') - first_day).astype(int)), 0), days)
+    end_index = min(max(int((np.datetime64(end_date, 'D') - first_day).astype(int)) + 1, start_index), days)
+
+    totals = cumulative_minutes[end_index] - cumulative_minutes[start_index]
+    return dict(zip(ACTIVITY_COLUMNS, totals))
+
+
+def build_contract_hours_matrix(cumulative):
+    """
+    Build a dense ship x day matrix of the hours that count towards the contract hours.
+
+    Parameters:
+    cumulative (dict): The result of build_cumulative_minutes.
+
+    Returns:
+    tuple: The sorted list of ships, an array with the days (datetime64[D]) and the matrix of shape (ships, days).
+    Days outside the period covered by the reports of a ship are NaN.
+    """
+    ships = sorted(cumulative)
+    first_day = min(cumulative[ship][0] for ship in ships)
+    last_day = max(cumulative[ship][0] + len(cumulative[ship][1]) - 2 for ship in ships)
+    days = np.arange(first_day, last_day + 1)
+
+    contract_indices = [ACTIVITY_COLUMNS.index(column) for column in CONTRACT_COLUMNS]
+    matrix = np.full((len(ships), len(days)), np.nan)
+    for i, ship in enumerate(ships):
+        ship_first_day, cumulative_minutes = cumulative[ship]
+        hours_per_day = np.diff(cumulative_minutes[:, contract_indices].sum(axis=1)) / 60
+        offset = int((ship_first_day - first_day).astype(int))
+        matrix[i, offset:offset + len(hours_per_day)] = hours_per_day
+
+    return ships, days, matrix
+
+
 # Assuming 'df' is your DataFrame with 'Start' and 'Einde' columns in datetime format
 def split_rows_on_day_change(df):
     df = df.drop(columns=['index'])  # Drop the 'index' column
@@ -217,28 +298,28 @@ def split_rows_on_day_change(df):
     return new_df
 
 
-# Generic function to get week number with a custom start of the week
-def week_number_custom_start(dt, start_weekday):
+# Generic function to get the week numbers with a custom start of the week
+def week_numbers_custom_start(dts, start_weekday, date_format='%U'):
     """
-    Get the week number with a custom start day of the week.
+    Get the week numbers of a Series of datetimes with a custom start day of the week.
 
     Parameters:
-    dt (datetime): The input date.
-    start_weekday (int): The start of the week (0 = Monday, 6 = Sunday).
+    dts (Series): The input dates.
+    start_weekday (str): The start of the week, e.g. 'Saturday'.
+    date_format (str): The format of the week number, '%Y-%U' includes the year of the start of the week, so weeks
+    of different years differ.
 
     Returns:
-    str: The week number as a string.
+    Series: The week numbers as strings.
     """
-
-    dt = pd.to_datetime(dt)
+    dts = pd.to_datetime(dts)
     start_weekday = weekday_string_to_int(start_weekday)
 
-    # Adjust the date based on the custom start weekday
-    shift_days = (dt.weekday() - start_weekday + 7) % 7
-    adjusted_date = dt - pd.Timedelta(days=shift_days)
+    shift_days = (dts.dt.weekday - start_weekday + 7) % 7
+    adjusted_dates = dts - pd.to_timedelta(shift_days, unit='D')
+
+    return adjusted_dates.dt.strftime(date_format)
 
-    # Return the week number with Sunday as the start (after adjustment)
-    return adjusted_date.strftime('%U')
 
 def weekday_string_to_int(weekday_str):
     # Mapping of weekday strings to integers
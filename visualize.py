@@ -1,9 +1,31 @@
+import logging
+import math
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
 import streamlit as st
 import plotly.express as px
 import pandas as pd
+import sessions
 import utils
 from datetime import timedelta
 
+logger = logging.getLogger(__name__)
+
+# Plotly figures and their estimated size in bytes, keyed by (dataset hash, chart, week start, week end, ship,
+# start weekday), shared by all sessions
+FIGURE_CACHE_SIZE = 64
+_figure_cache = OrderedDict()
+# Per key an Event that is set when the figure that is being built is in the cache
+_figure_builds_in_progress = {}
+_figure_cache_lock = threading.Lock()
+# A single worker builds the figures of adjacent weeks in the background
+_prefetch_queue = queue.Queue()
+_prefetch_thread = None
+
 
 def write_week_info(start, start_of_week, end):
     weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
@@ -48,87 +70,274 @@ def show_week_hours(df, ship, start, ship_config):
         col5.metric("Rest hours", rest_time)
 
 
+HOURS_TABLE_PAGE_SIZE = 50
+
+HOURS_TABLE_COLUMN_CONFIG = {
+    'Sailing hours': st.column_config.NumberColumn(format='%.1f'),
+    'Speed (avg.)': st.column_config.NumberColumn(format='%.1f'),
+    '(Un)load hours': st.column_config.NumberColumn(format='%.1f'),
+    'Waiting hours': st.column_config.NumberColumn(format='%.1f'),
+    'Working hours': st.column_config.NumberColumn(format='%.1f'),
+    'Contract hours': st.column_config.NumberColumn(format='%.1f'),
+    'Rest hours': st.column_config.NumberColumn(format='%.1f'),
+    'Below contract': st.column_config.CheckboxColumn(help='Working hours are below the contract hours'),
+}
+
+
+def build_week_hours_table(week_rows, start_of_week):
+    """
+    Build the table of weekly hours from the first row of each week, without the contract hours.
+
+    :param week_rows: The first row of each week and ship of the DataFrame from utils.split_dataframe_into_weeks.
+    :param start_of_week: The day on which the administrative week starts.
+    :return: DataFrame with one typed row per ship and week.
+    """
+    df_to_show = pd.DataFrame({
+        # Including the year, so that weeks of different years are not mixed up when filtering and sorting
+        'Week': utils.week_numbers_custom_start(week_rows['Start'], start_of_week, '%Y-%U'),
+        'Ship': week_rows['Schip'],
+        'Sailing hours': week_rows['Vaaruren_week'].round(1),
+        'Speed (avg.)': week_rows['Snelheid_week_gem'].round(1),
+        '(Un)load hours': week_rows['Laad/Lostijd_week'].round(1),
+        'Waiting hours': week_rows['Wachttijd_week'].round(1),
+        'Working hours': week_rows['Tijd onder contract'].round(1),
+        'Rest hours': week_rows['Rusttijd_week'].round(1),
+    })
+    return df_to_show.reset_index(drop=True)
+
+
+def build_period_hours_table(df, start_of_week):
+    """
+    Build the weekly hours of all weeks and ships, once per processed DataFrame.
+
+    Only the contract hours, which can be edited, are added per render, see add_contract_hours.
+    """
+    # The first row of each week of each ship
+    return build_week_hours_table(df.drop_duplicates(['Schip', 'Tijd onder contract']), start_of_week)
+
+
+def add_contract_hours(hours_table, ship_config):
+    """
+    Add the contract hours and the boolean 'Below contract' column to a table of weekly hours.
+
+    :param hours_table: The result of build_week_hours_table, which is not modified.
+    :param ship_config: The weekly contract hours per ship, ships that are not in it are left out.
+    """
+    hours_table = hours_table[hours_table['Ship'].isin(list(ship_config))]
+    contract_hours = hours_table['Ship'].map(ship_config).astype(float)
+    columns = list(hours_table.columns)
+    columns.insert(columns.index('Rest hours'), 'Contract hours')
+    df_to_show = hours_table.assign(**{'Contract hours': contract_hours,
+                                       'Below contract': hours_table['Working hours'] < contract_hours})
+    return df_to_show[columns + ['Below contract']].reset_index(drop=True)
+
+
+def build_hours_table(week_rows, ship_config, start_of_week):
+    """ Build the table of weekly hours from the first row of each week, including the contract hours. """
+    return add_contract_hours(build_week_hours_table(week_rows, start_of_week), ship_config)
+
+
+def show_hours_table(df_to_show):
+    """ Show a table of weekly hours as Arrow data, with column-level number formatting. """
+    st.dataframe(pa.Table.from_pandas(df_to_show, preserve_index=False), width=1400, hide_index=True,
+                 column_config=HOURS_TABLE_COLUMN_CONFIG)
+
+
 def show_week_hours_as_df(df, start, ship_config, start_of_week):
-    columns = ['Week', 'Ship', 'Sailing hours', 'Speed (avg.)', '(Un)load hours', 'Waiting hours', 'Working hours',
-               'Contract hours', 'Rest hours']
-
-    df_to_show = pd.DataFrame(columns=columns)
-    for ship in ship_config:
-        filtered_df = df[df['Schip'] == ship]
-        if start.date() in filtered_df['Start_Date'].values:
-            week = utils.week_number_custom_start(start, start_of_week)
-            sailing_time = round(filtered_df[filtered_df['Start'] == start]['Vaaruren_week'], 1)
-            speed = round(filtered_df[filtered_df['Start'] == start]['Snelheid_week_gem'], 1)
-            waiting_time = round(filtered_df[filtered_df['Start'] == start]['Wachttijd_week'], 1)
-            terminal_time = round(filtered_df[filtered_df['Start'] == start]['Laad/Lostijd_week'], 1)
-            working_hours = round(filtered_df[filtered_df['Start'] == start]['Tijd onder contract'].values[0], 1)
-            contract_hours = ship_config[ship]
-            rest_time = round(filtered_df[filtered_df['Start'] == start]['Rusttijd_week'], 1)
-            new_row = {'Week': week, 'Ship': ship, 'Sailing hours': sailing_time, 'Speed (avg.)': speed,
-                       '(Un)load hours': terminal_time, 'Waiting hours': waiting_time, 'Working hours': working_hours,
-                       'Contract hours': contract_hours, 'Rest hours': rest_time}
-            entry = pd.DataFrame.from_dict(new_row)
-            df_to_show = pd.concat([df_to_show, entry], ignore_index=True)
-
-    # Set display format for floats
-    pd.options.display.float_format = '{:.1f}'.format  # Adjust the number of decimal places as needed
-
-    # Apply the style only to the 'Total hours' column based on the corresponding Threshold
-    styled_df = df_to_show.style.apply(lambda row: highlight_rows(row, ship_config, df_to_show.columns), axis=1)
-
-    # Display the styled DataFrame in Streamlit
-    st.dataframe(styled_df, width=1400)
-
-
-def show_period_hours_as_df(df, ship_config, start_of_week):
-    columns = ['Week', 'Ship', 'Sailing hours', 'Speed (avg.)', '(Un)load hours', 'Waiting hours', 'Working hours',
-               'Contract hours', 'Rest hours']
-    df_to_show = pd.DataFrame(columns=columns)
-    for ship in ship_config:
-        filtered_df = df[df['Schip'] == ship]
-        unique_values = filtered_df['Tijd onder contract'].unique()
-        for unique_value in unique_values:
-            row = filtered_df[filtered_df['Tijd onder contract'] == unique_value].head(1)
-            week = utils.week_number_custom_start(row['Start'].values[0], start_of_week)
-            sailing_time = round(row['Vaaruren_week'].values[0], 1)
-            speed = round(row['Snelheid_week_gem'].values[0], 1)
-            waiting_time = round(row['Wachttijd_week'].values[0], 1)
-            terminal_time = round(row['Laad/Lostijd_week'].values[0], 1)
-            working_hours = round(row['Tijd onder contract'].values[0], 1)
-            contract_hours = ship_config[ship]
-            rest_time = round(row['Rusttijd_week'].values[0], 1)
-            new_row = {'Week': [week], 'Ship': [ship], 'Sailing hours': [sailing_time], 'Speed (avg.)': [speed],
-                       '(Un)load hours': [terminal_time], 'Waiting hours': [waiting_time],
-                       'Working hours': [working_hours], 'Contract hours': [contract_hours], 'Rest hours': [rest_time]}
-            entry = pd.DataFrame.from_dict(new_row)
-            df_to_show = pd.concat([df_to_show, entry], ignore_index=True)
-
-    # Set display format for floats
-    pd.options.display.float_format = '{:.1f}'.format  # Adjust the number of decimal places as needed
-
-    # Apply the style only to the 'Total hours' column based on the corresponding Threshold
-    styled_df = df_to_show.style.apply(lambda row: highlight_rows(row, ship_config, df_to_show.columns), axis=1)
-
-    # Display the styled DataFrame in Streamlit
-    st.dataframe(styled_df, width=1400)
-
-
-# Function to highlight Total hours based on the corresponding Threshold value
-def highlight_total_hours(total_hours, threshold):
-    return 'background-color: red' if total_hours < threshold else ''
-
-
-# Create a function to apply styles only to the "Total hours" column
-def highlight_rows(row, ship_config, columns):
-    styles = [''] * len(row)  # Create a list with the same length as the row, initialized with empty strings
-    total_hours = row['Working hours']
-    ship_name = row['Ship']
-
-    # Highlight only the 'Total hours' cell
-    total_hours_index = columns.get_loc('Working hours')
-    styles[total_hours_index] = highlight_total_hours(total_hours, ship_config[ship_name])
-
-    return styles
+    week_rows = df[(df['Start'] == start) & df['Schip'].isin(list(ship_config))]
+    week_rows = week_rows.drop_duplicates('Schip')
+    show_hours_table(build_hours_table(week_rows, ship_config, start_of_week))
+
+
+def show_period_hours_as_df(period_hours_table, ship_config):
+    """
+    Show the weekly hours of all weeks, filtered, sorted and paged on the server.
+
+    :param period_hours_table: The result of build_period_hours_table, built once per processed DataFrame.
+    :param ship_config: The weekly contract hours per ship.
+    """
+    df_to_show = add_contract_hours(period_hours_table, ship_config)
+
+    # Filter and sort on the server, so only a single page is sent to the browser
+    col1, col2, col3, col4 = st.columns(4)
+    ships = col1.multiselect('Ship', df_to_show['Ship'].unique().tolist(), key='period_hours_ships')
+    weeks = col2.multiselect('Week', sorted(df_to_show['Week'].unique().tolist()), key='period_hours_weeks')
+    sort_column = col3.selectbox('Sort by', ['Ship', 'Week', 'Working hours', 'Below contract'],
+                                 key='period_hours_sort')
+    descending = col4.toggle('Descending', key='period_hours_descending')
+    if ships:
+        df_to_show = df_to_show[df_to_show['Ship'].isin(ships)]
+    if weeks:
+        df_to_show = df_to_show[df_to_show['Week'].isin(weeks)]
+    df_to_show = df_to_show.sort_values(sort_column, ascending=not descending, kind='stable')
+
+    pages = max(math.ceil(len(df_to_show) / HOURS_TABLE_PAGE_SIZE), 1)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f'Page (of {pages})', min_value=1, max_value=pages, value=1,
+                               key='period_hours_page')
+    start_row = (page - 1) * HOURS_TABLE_PAGE_SIZE
+    show_hours_table(df_to_show.iloc[start_row:start_row + HOURS_TABLE_PAGE_SIZE])
+
+
+def show_range_hours_as_df(cumulative, ship_config, start_date, end_date):
+    ships = [ship for ship in ship_config if ship in cumulative]
+    minutes = pd.DataFrame([utils.get_range_minutes(cumulative, ship, start_date, end_date) for ship in ships],
+                           columns=utils.ACTIVITY_COLUMNS, dtype=float)
+    working_hours = (minutes[utils.CONTRACT_COLUMNS].sum(axis=1) / 60).round(1)
+    # Weekly contract hours scaled to the number of days in the range
+    days = (end_date - start_date).days + 1
+    contract_hours = pd.Series([ship_config[ship] for ship in ships], dtype=float) * days / 7
+    df_to_show = pd.DataFrame({
+        'Ship': pd.Series(ships, dtype=object),
+        'Sailing hours': (minutes['Vaaruren'] / 60).round(1),
+        '(Un)load hours': (minutes['Laad/Lostijd'] / 60).round(1),
+        'Waiting hours': (minutes['Wachttijd'] / 60).round(1),
+        'Working hours': working_hours,
+        'Contract hours': contract_hours,
+        'Rest hours': (minutes['Rusttijd'] / 60).round(1),
+        'Below contract': working_hours < contract_hours,
+    })
+    show_hours_table(df_to_show)
+
+
+def show_custom_period(cumulative, ship_config):
+    # The period covered by the reports, taken from the cumulative minutes instead of scanning the DataFrame
+    first_day = min(ship_first_day for ship_first_day, _ in cumulative.values())
+    last_day = max(ship_first_day + len(cumulative_minutes) - 2
+                   for ship_first_day, cumulative_minutes in cumulative.values())
+    first_day, last_day = first_day.astype(object), last_day.astype(object)
+
+    period = st.date_input("Select the period to summarize:", value=(first_day, last_day),
+                           min_value=first_day, max_value=last_day, format="DD-MM-YYYY")
+    if len(period) == 2:
+        show_range_hours_as_df(cumulative, ship_config, period[0], period[1])
+
+
+def fleet_utilization_heatmap(ships, days, contract_hours_matrix, ship_config):
+    """
+    Description: This visualization shows per ship and day which share of the daily contract hours was used.
+    Purpose: Compare the utilization of the whole fleet at a glance, also with many ships.
+    Type: Heatmap (a single trace, regardless of the number of ships)
+    Values used: Sailing, waiting and (un)load hours per day, weekly contract hours per ship
+    Title: Fleet Utilization
+    X-axis: Date
+    Y-axis: Ship
+    :param ships: The ships in the order of the rows of the matrix.
+    :param days: The days in the order of the columns of the matrix.
+    :param contract_hours_matrix: The ship x day matrix of utils.build_contract_hours_matrix.
+    :param ship_config: The weekly contract hours per ship.
+    :return: Fleet utilization heatmap in streamlit app
+    """
+    daily_contract_hours = np.array([ship_config.get(ship, 0) for ship in ships], dtype=float) / 7
+    with np.errstate(divide='ignore', invalid='ignore'):
+        utilization = np.where(daily_contract_hours[:, None] > 0,
+                               contract_hours_matrix / daily_contract_hours[:, None] * 100, np.nan)
+
+    fig = px.imshow(utilization, x=days, y=ships, aspect='auto', color_continuous_scale='RdYlGn',
+                    range_color=[0, 100], title='Fleet Utilization',
+                    labels={'x': 'Date', 'y': 'Ship', 'color': 'Utilization (%)'})
+
+    return fig
+
+
+def dataset_hash(df):
+    """ Return a hash identifying the contents of the processed DataFrame. """
+    return int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+def _build_figure(df, chart, start, end, ship):
+    if chart == 'gantt':
+        return VisualisationPlanning(df).calls_gantt_chart(start, end, ship)
+    return VisualisationPlanning(df).activity_line_chart(start)
+
+
+def _cached_figure(df, df_hash, chart, start, end, ship, start_of_week):
+    key = (df_hash, chart, start, end, ship, start_of_week)
+    while True:
+        with _figure_cache_lock:
+            if key in _figure_cache:
+                _figure_cache.move_to_end(key)
+                return _figure_cache[key][0]
+            in_progress = _figure_builds_in_progress.get(key)
+            if in_progress is None:
+                in_progress = _figure_builds_in_progress[key] = threading.Event()
+                break
+        # Another session or the prefetch worker is building this figure, wait for it instead of building it twice
+        in_progress.wait()
+
+    try:
+        fig = _build_figure(df, chart, start, end, ship)
+        nbytes = sessions.estimate_nbytes(fig.to_plotly_json())
+        with _figure_cache_lock:
+            _figure_cache[key] = (fig, nbytes)
+            _figure_cache.move_to_end(key)
+            while len(_figure_cache) > FIGURE_CACHE_SIZE:
+                _figure_cache.popitem(last=False)
+        return fig
+    finally:
+        with _figure_cache_lock:
+            del _figure_builds_in_progress[key]
+        in_progress.set()
+
+
+def figure_cache_nbytes():
+    """ Return the estimated size in bytes of the figures in the cache. """
+    with _figure_cache_lock:
+        return sum(nbytes for _, nbytes in _figure_cache.values())
+
+
+def cached_gantt_chart(df, df_hash, start, end, start_of_week, ship=None):
+    """
+    Return the Gantt chart of the given week, built once per dataset, week and ship.
+
+    The figure is shared between reruns and sessions, so it must not be modified.
+    """
+    return _cached_figure(df, df_hash, 'gantt', start, end, ship, start_of_week)
+
+
+def cached_activity_line_chart(df, df_hash, start, start_of_week):
+    """
+    Return the per-day activity chart of the given week, built once per dataset and week.
+
+    The figure is shared between reruns and sessions, so it must not be modified.
+    """
+    return _cached_figure(df, df_hash, 'activity', start, None, None, start_of_week)
+
+
+def _prefetch_worker():
+    while True:
+        args = _prefetch_queue.get()
+        try:
+            _cached_figure(*args)
+        except Exception:
+            # The chart is built again when the week is selected, but a failure here can be a bug in the chart code
+            logger.exception('Prefetching the %s chart of the week starting at %s failed', args[2], args[3])
+
+
+def prefetch_adjacent_weeks(df, df_hash, weeks, start, start_of_week, ship=None):
+    """
+    Queue the charts of the weeks before and after the selected week for the background prefetch worker.
+
+    :param weeks: Sorted list of (start, end) tuples of the weeks that can be selected.
+    :param start: The start of the currently selected week.
+    """
+    global _prefetch_thread
+    starts = [week_start for week_start, _ in weeks]
+    if start not in starts:
+        return
+    index = starts.index(start)
+    adjacent = [weeks[i] for i in (index - 1, index + 1) if 0 <= i < len(weeks)]
+
+    with _figure_cache_lock:
+        if _prefetch_thread is None:
+            _prefetch_thread = threading.Thread(target=_prefetch_worker, daemon=True)
+            _prefetch_thread.start()
+        for week_start, week_end in adjacent:
+            for chart, end, chart_ship in (('gantt', week_end, ship), ('activity', None, None)):
+                key = (df_hash, chart, week_start, end, chart_ship, start_of_week)
+                if key not in _figure_cache and key not in _figure_builds_in_progress:
+                    _prefetch_queue.put((df, df_hash, chart, week_start, end, chart_ship, start_of_week))
 
 
 class UploadSailReport:
@@ -242,7 +451,9 @@ class VisualisationPlanning:
         # Define a color map for the 'Van' categories
         color_map = {'Varen': 'green', 'Wachten': 'blue', 'Rust': 'brown', 'Terminal': 'pink'}
 
-        filtered_df["Activiteit"] = filtered_df["Van"].apply(lambda x: x if x in color_map else "Terminal")
+        # Add the column with assign, self.df is shared between sessions and must not be modified
+        filtered_df = filtered_df.assign(Activiteit=filtered_df["Van"].where(filtered_df["Van"].isin(color_map),
+                                                                            "Terminal"))
 
         # Create Gantt chart with 'Van' column as color, and apply the color map
         fig = px.timeline(filtered_df,
@@ -304,13 +515,12 @@ class VisualisationPlanning:
     def activity_trend(self):
         # Convert Start and Einde columns to datetime
 
-        _filtered_df = self.df.copy()
-        # Extract day from Start time
-        _filtered_df['Dag'] = _filtered_df['Start'].dt.date
+        # Extract day from Start time, only taking the columns needed instead of copying the whole DataFrame
+        _filtered_df = self.df[["Vaaruren", "Wachttijd", "Rusttijd", "Laad/Lostijd", "Schip"]].assign(
+            Dag=self.df['Start'].dt.date)
 
         # Reindex, set dag as index and sort by index
         _filtered_df = _filtered_df.set_index('Dag').sort_index()
-        _filtered_df = _filtered_df[["Vaaruren", "Wachttijd", "Rusttijd", "Laad/Lostijd", "Schip"]]
         _filtered_df.rename(
             columns={"Vaaruren": "Varen", "Wachttijd": "Wachten", "Rusttijd": "Rust", "Laad/Lostijd": "Terminal"},
             inplace=True)